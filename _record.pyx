@@ -0,0 +1,247 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+"""
+C implementations of the record/cell decoding hot path in parse_database.py.
+
+parse_database imports these when the extension has been built (`cythonize -i _record.pyx`), and falls back to its
+pure python versions otherwise, so the two have to stay in sync.
+"""
+from libc.stdint cimport uint8_t, uint16_t, uint32_t, uint64_t, int8_t, int16_t, int32_t, int64_t
+from libc.string cimport memcpy
+from cpython.unicode cimport PyUnicode_DecodeUTF8
+
+from codecs import utf_8_decode
+
+cdef extern from *:
+    """
+    #if defined(__BYTE_ORDER__) && __BYTE_ORDER__ == __ORDER_BIG_ENDIAN__
+    #define SQLP_BE16(x) (x)
+    #define SQLP_BE32(x) (x)
+    #define SQLP_BE64(x) (x)
+    #else
+    #define SQLP_BE16(x) __builtin_bswap16(x)
+    #define SQLP_BE32(x) __builtin_bswap32(x)
+    #define SQLP_BE64(x) __builtin_bswap64(x)
+    #endif
+    """
+    uint16_t SQLP_BE16(uint16_t x) nogil
+    uint32_t SQLP_BE32(uint32_t x) nogil
+    uint64_t SQLP_BE64(uint64_t x) nogil
+    int __builtin_clzll(unsigned long long x) nogil
+
+
+cdef enum:
+    # Page type ids, see BTreePageType
+    TABLE_INTERIOR = 0x05
+    TABLE_LEAF = 0x0D
+    INDEX_INTERIOR = 0x02
+    INDEX_LEAF = 0x0A
+
+cdef uint64_t VARINT_MSBS = 0x8080808080808080ULL
+cdef uint64_t VARINT_LOW7 = 0x7F7F7F7F7F7F7F7FULL
+
+
+cdef inline uint16_t load_u16(const uint8_t *p) noexcept nogil:
+    cdef uint16_t x
+    memcpy(&x, p, 2)
+    return SQLP_BE16(x)
+
+
+cdef inline uint32_t load_u32(const uint8_t *p) noexcept nogil:
+    cdef uint32_t x
+    memcpy(&x, p, 4)
+    return SQLP_BE32(x)
+
+
+cdef inline uint64_t load_u64(const uint8_t *p) noexcept nogil:
+    cdef uint64_t x
+    memcpy(&x, p, 8)
+    return SQLP_BE64(x)
+
+
+cdef inline uint64_t pack_7bit_groups(uint64_t x) noexcept nogil:
+    x = (x & 0x007F007F007F007FULL) | ((x & 0x7F007F007F007F00ULL) >> 1)
+    x = (x & 0x00003FFF00003FFFULL) | ((x & 0x3FFF00003FFF0000ULL) >> 2)
+    return (x & 0x000000000FFFFFFFULL) | ((x & 0x0FFFFFFF00000000ULL) >> 4)
+
+
+cdef inline Py_ssize_t c_read_varint(const uint8_t *buf, Py_ssize_t size, Py_ssize_t pos, uint64_t *value) except -1:
+    """
+    Same SWAR scheme as parse_database.read_varint. Stores the decoded value and returns the new position.
+    """
+    cdef uint8_t tail[8]
+    cdef uint64_t word, stops
+    cdef Py_ssize_t n
+    if pos >= size:
+        raise ValueError(f"varint at offset 0x{pos:08x} runs off the end of the buffer")
+    if size - pos >= 8:
+        word = load_u64(buf + pos)
+    else:
+        # Too close to the end of the buffer for a full 8 byte load, so pad with zeros
+        tail[:] = [0, 0, 0, 0, 0, 0, 0, 0]
+        memcpy(tail, buf + pos, size - pos)
+        word = load_u64(tail)
+    stops = ~word & VARINT_MSBS
+    # Bit 0 is never a stop bit, so or-ing it in keeps clz defined without moving the first real stop bit. A word
+    # with no stop bit then counts as 8 bytes, and the comparison adds the 9th.
+    n = (__builtin_clzll(stops | 1) >> 3) + 1 + (stops == 0)
+    if n == 9:
+        if size - pos < 9:
+            raise ValueError(f"varint at offset 0x{pos:08x} runs off the end of the buffer")
+        value[0] = (pack_7bit_groups(word & VARINT_LOW7) << 8) | buf[pos + 8]
+        return pos + 9
+    if pos + n > size:
+        # The stop bit came from the zero padding, so the buffer ends part way through the varint
+        raise ValueError(f"varint at offset 0x{pos:08x} runs off the end of the buffer")
+    value[0] = pack_7bit_groups((word >> (8 * (8 - n))) & VARINT_LOW7)
+    return pos + n
+
+
+def read_varint(const unsigned char[::1] buf, Py_ssize_t pos):
+    cdef uint64_t value
+    pos = c_read_varint(&buf[0], buf.shape[0], pos, &value)
+    return value, pos
+
+
+cdef inline int64_t sign_extend(int64_t x, int bits) noexcept nogil:
+    cdef int64_t sign_bit = 1LL << (bits - 1)
+    return (x ^ sign_bit) - sign_bit
+
+
+cdef inline void check_bounds(Py_ssize_t off, Py_ssize_t n, Py_ssize_t size) except *:
+    if off + n > size:
+        raise ValueError(f"field at offset 0x{off:08x} runs off the end of the buffer")
+
+
+def parse_record_header(const unsigned char[::1] buf, Py_ssize_t off):
+    cdef const uint8_t *p = &buf[0]
+    cdef Py_ssize_t size = buf.shape[0]
+    cdef Py_ssize_t record_start_offset = off
+    cdef Py_ssize_t header_end, i
+    cdef uint64_t header_size, dtype
+    cdef list dtypes = []
+    cdef list field_offsets
+
+    off = c_read_varint(p, size, off, &header_size)
+    header_end = record_start_offset + <Py_ssize_t>header_size
+    while off < header_end:
+        if header_end - off >= 8 and size - off >= 8 and (load_u64(p + off) & VARINT_MSBS) == 0:
+            # 8 single byte dtypes in a row, which is the usual case for a wide record
+            for i in range(8):
+                dtypes.append(p[off + i])
+            off += 8
+        else:
+            off = c_read_varint(p, size, off, &dtype)
+            dtypes.append(dtype)
+    field_offsets = [0] * len(dtypes)
+    for i in range(len(dtypes)):
+        field_offsets[i] = off
+        dtype = dtypes[i]
+        if dtype == 0 or dtype == 8 or dtype == 9:
+            pass
+        elif dtype <= 4:
+            off += <Py_ssize_t>dtype
+        elif dtype == 5:
+            off += 6
+        elif dtype <= 7:
+            off += 8
+        elif dtype >= 12:  # blob/text
+            off += <Py_ssize_t>((dtype - 12) // 2)
+        else:
+            raise ValueError(
+                f"Unexpected dtype: {dtype} at record starting at offset: 0x{record_start_offset:08x}, field: {i} (of {len(dtypes)} fields) at offset: {off:08x}")
+    return dtypes, field_offsets
+
+
+cdef object c_decode_field(const uint8_t *p, Py_ssize_t size, Py_ssize_t off, uint64_t dtype, decode_text):
+    cdef Py_ssize_t n
+    cdef uint64_t bits
+    cdef double dval
+
+    if dtype == 0:
+        return None
+    elif dtype == 1:
+        check_bounds(off, 1, size)
+        return <int8_t>p[off]
+    elif dtype == 2:
+        check_bounds(off, 2, size)
+        return <int16_t>load_u16(p + off)
+    elif dtype == 3:
+        check_bounds(off, 3, size)
+        return sign_extend((<int64_t>p[off] << 16) | (<int64_t>p[off + 1] << 8) | p[off + 2], 24)
+    elif dtype == 4:
+        check_bounds(off, 4, size)
+        return <int32_t>load_u32(p + off)
+    elif dtype == 5:
+        check_bounds(off, 6, size)
+        return sign_extend(<int64_t>load_u16(p + off) << 32 | load_u32(p + off + 2), 48)
+    elif dtype == 6:
+        check_bounds(off, 8, size)
+        return <int64_t>load_u64(p + off)
+    elif dtype == 7:
+        check_bounds(off, 8, size)
+        bits = load_u64(p + off)
+        memcpy(&dval, &bits, 8)
+        return dval
+    elif dtype == 8:
+        return 0
+    elif dtype == 9:
+        return 1
+    elif dtype >= 12 and dtype % 2 == 0:  # blob
+        n = <Py_ssize_t>((dtype - 12) // 2)
+        check_bounds(off, n, size)
+        return <bytes>p[off:off + n]
+    elif dtype >= 13:  # text
+        n = <Py_ssize_t>((dtype - 13) // 2)
+        check_bounds(off, n, size)
+        if decode_text is utf_8_decode:
+            # By far the most common case, so skip the call through the decoder and decode straight from the buffer
+            return PyUnicode_DecodeUTF8(<const char *>p + off, n, NULL)
+        return decode_text(<bytes>p[off:off + n], 'strict', True)[0]
+    raise ValueError(f"Unexpected dtype: {dtype} at offset: {off:08x}")
+
+
+def decode_field(const unsigned char[::1] buf, Py_ssize_t off, uint64_t dtype, decode_text):
+    return c_decode_field(&buf[0], buf.shape[0], off, dtype, decode_text)
+
+
+def decode_fields(const unsigned char[::1] buf, list field_offsets, list dtypes, decode_text):
+    cdef const uint8_t *p = &buf[0]
+    cdef Py_ssize_t size = buf.shape[0]
+    cdef Py_ssize_t i, n = len(dtypes)
+    cdef list values = [None] * n
+    for i in range(n):
+        values[i] = c_decode_field(p, size, field_offsets[i], dtypes[i], decode_text)
+    return values
+
+
+def parse_page_cells(const unsigned char[::1] buf, Py_ssize_t ptrs_offset, Py_ssize_t num_cells, int page_type):
+    cdef const uint8_t *p = &buf[0]
+    cdef Py_ssize_t size = buf.shape[0]
+    cdef Py_ssize_t i, off
+    cdef uint64_t payload_size, row_id
+    cdef uint32_t child_page_ptr
+    cdef list cells = [None] * num_cells
+
+    check_bounds(ptrs_offset, 2 * num_cells, size)
+    if page_type not in (TABLE_LEAF, TABLE_INTERIOR, INDEX_INTERIOR, INDEX_LEAF):
+        raise ValueError(f"Unsupported page type: {page_type}")
+    for i in range(num_cells):
+        off = load_u16(p + ptrs_offset + 2 * i)
+        if page_type == TABLE_LEAF:
+            off = c_read_varint(p, size, off, &payload_size)
+            off = c_read_varint(p, size, off, &row_id)
+            cells[i] = (row_id, payload_size, off)
+        elif page_type == TABLE_INTERIOR:
+            check_bounds(off, 4, size)
+            child_page_ptr = load_u32(p + off)
+            c_read_varint(p, size, off + 4, &row_id)
+            cells[i] = (child_page_ptr, row_id)
+        elif page_type == INDEX_INTERIOR:
+            check_bounds(off, 4, size)
+            child_page_ptr = load_u32(p + off)
+            off = c_read_varint(p, size, off + 4, &payload_size)
+            cells[i] = (child_page_ptr, payload_size, off)
+        else:
+            off = c_read_varint(p, size, off, &payload_size)
+            cells[i] = (payload_size, off)
+    return cells
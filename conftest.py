@@ -0,0 +1 @@
+# Lets pytest import parse_database from the repo root without installing anything
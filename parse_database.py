@@ -1,34 +1,94 @@
-import os
+import codecs
+import mmap
 import struct
+import sys
 from abc import ABC, abstractmethod
+from array import array
 from bisect import bisect_left
 from dataclasses import dataclass
 from enum import Enum
-from io import BytesIO
-from typing import Optional, List, BinaryIO
+from operator import attrgetter
+from typing import Optional, List, BinaryIO, Union, Callable
 
 FILE_NAME = "./example.db"
 TARGET_ROW_ID = 450
 TARGET_EMAIL_ID = "user_450@example.com"
+# Database files smaller than this are read into memory in one go, anything bigger gets mmapped
+_IN_MEMORY_MAX_SIZE = 64 * 1024 * 1024
+
+_U32_BE = struct.Struct(">I")
+_I16_BE = struct.Struct(">h")
+_I32_BE = struct.Struct(">i")
+_I64_BE = struct.Struct(">q")
+_F64_BE = struct.Struct(">d")
+_FILEHDR = struct.Struct(">16sH6B12i20x2i")
+_PAGEHDR = struct.Struct(">3HB")
+_INTERIOR_PAGEHDR = struct.Struct(">3HBI")
+
+# Text encoding names by the id stored in the file header, along with their decoders. Resolving the decoder once up
+# front means decoding a text field doesn't go through the codec registry lookup by name every time.
+_TEXT_ENCODINGS = {
+    1: ('utf-8', codecs.utf_8_decode),
+    2: ('utf-16-le', codecs.utf_16_le_decode),
+    3: ('utf-16-be', codecs.utf_16_be_decode),
+}
+
+
+_VARINT_MSBS = 0x8080808080808080
+_VARINT_LOW7 = 0x7F7F7F7F7F7F7F7F
+# Indexed by varint length: how far to shift the loaded word right so the varint's bytes are the low ones
+_VARINT_SHIFTS = tuple(8 * (8 - n) for n in range(9))
+
+
+def read_varint(buf, pos):
+    """
+    Decode the sqlite varint starting at buf[pos]. Returns (value, new_pos).
+
+    Nearly every varint in a database (dtypes, payload sizes, row ids) is one or two bytes long, and in python
+    the multi-digit int arithmetic of the general case costs several times more than handling those directly.
+    Anything longer loads 8 bytes as one big-endian int, finds the terminating byte (the first one with its
+    high bit clear) from the continuation mask, and then packs the 7-bit groups together with a few SWAR
+    shift/mask steps.
+    """
+    if pos >= len(buf):
+        raise ValueError(f"varint at offset 0x{pos:08x} runs off the end of the buffer")
+    first = buf[pos]
+    if first < 0x80:
+        return first, pos + 1
+    if pos + 1 < len(buf):
+        second = buf[pos + 1]
+        if second < 0x80:
+            return ((first & 0x7F) << 7) | second, pos + 2
+    chunk = buf[pos:pos + 8]
+    word = int.from_bytes(chunk, 'big') << (8 * (8 - len(chunk)))
+    stops = ~word & _VARINT_MSBS
+    # The stop bits sit at 64 - 8 * n, so the length falls straight out of bit_length. No stop bit at all gives 9.
+    n = (72 - stops.bit_length()) >> 3
+    if n == 9:
+        # All 8 bytes have the continuation bit set, so the 9th byte contributes a full 8 bits
+        if pos + 8 >= len(buf):
+            raise ValueError(f"varint at offset 0x{pos:08x} runs off the end of the buffer")
+        return (_pack_7bit_groups(word & _VARINT_LOW7) << 8) | buf[pos + 8], pos + 9
+    if n > len(chunk):
+        # The stop bit came from the zero padding, so the buffer ends part way through the varint
+        raise ValueError(f"varint at offset 0x{pos:08x} runs off the end of the buffer")
+    word = (word >> _VARINT_SHIFTS[n]) & _VARINT_LOW7
+    return _pack_7bit_groups(word), pos + n
+
+
+def _pack_7bit_groups(x):
+    # Squeeze out the (zeroed) high bit of every byte: 8x7 bits -> 4x14 -> 2x28 -> 1x56
+    x = (x & 0x007F007F007F007F) | ((x & 0x7F007F007F007F00) >> 1)
+    x = (x & 0x00003FFF00003FFF) | ((x & 0x3FFF00003FFF0000) >> 2)
+    return (x & 0x000000000FFFFFFF) | ((x & 0x0FFFFFFF00000000) >> 4)
 
 
-def read_varint(file):
-    ans = 0
-    for i in range(9):
-        val = file.read(1)[0]
-        if i < 8:
-            ans <<= 7
-            ans += val & ~0x80
-        else:
-            ans <<= 8
-            ans += val
-        if not (val & 0x80):
-            break
-    return ans
-
-
-@dataclass
 class FileHeader:
+    __slots__ = ('magic_bytes', 'page_size', 'format_write_version', 'format_read_version', 'reserved_bytes',
+                 'max_embedded_payload_frac', 'min_embedded_payload_frac', 'leaf_payload_frac', 'file_change_counter',
+                 'file_size_pages', 'freelist_trunk_ptr', 'num_freelist_pgs', 'schema_cookie', 'schema_format_number',
+                 'default_page_cache_size', 'largest_root_b_tree_ptr', 'text_encoding', 'decode_text', 'user_version',
+                 'vacuum_mode', 'app_id', 'version_valid_for', 'sqlite_version_number')
     magic_bytes: bytes
     page_size: int
     format_write_version: int
@@ -46,13 +106,15 @@ class FileHeader:
     default_page_cache_size: int
     largest_root_b_tree_ptr: int
     text_encoding: str
+    # One of the codecs.utf_*_decode functions, called as decode_text(data, errors, final) -> (text, bytes consumed)
+    decode_text: Callable[[memoryview, str, bool], tuple[str, int]]
     user_version: int
     vacuum_mode: bool
     app_id: int
     version_valid_for: int
     sqlite_version_number: int
 
-    def __init__(self, file: BinaryIO):
+    def __init__(self, buf: memoryview):
         (
             self.magic_bytes,
             self.page_size,
@@ -76,107 +138,180 @@ class FileHeader:
             self.app_id,
             self.version_valid_for,
             self.sqlite_version_number,
-        ) = struct.unpack(">16sH6B12i20x2i", file.read(100))
-        self.text_encoding = {
-            1: 'utf8',
-            2: 'utf16-le',
-            3: 'utf16-be'
-        }[text_encoding]
+        ) = _FILEHDR.unpack_from(buf, 0)
+        self.text_encoding, self.decode_text = _TEXT_ENCODINGS[text_encoding]
         self.vacuum_mode = vacuum_mode != 0
 
 
+def _reserved_dtype(dtype):
+    def decode(buf, offset):
+        raise ValueError(f"Unexpected dtype: {dtype} at offset: {offset:08x}")
+    return decode
+
+
+# Body size and decoder for each of the fixed-size dtypes, indexed by dtype. Every dtype >= 12 is a blob (even) or
+# text (odd) whose length is encoded in the dtype itself. Indexing a tuple is a single lookup, where a match statement
+# goes through the cases one by one (and text, the most common dtype, would be last).
+_FIXED_FIELD_SIZES = (0, 1, 2, 3, 4, 6, 8, 8, 0, 0, None, None)
+_FIXED_FIELD_DECODERS = (
+    lambda buf, offset: None,
+    lambda buf, offset: int.from_bytes(buf[offset:offset + 1], 'big', signed=True),
+    lambda buf, offset: _I16_BE.unpack_from(buf, offset)[0],
+    lambda buf, offset: int.from_bytes(buf[offset:offset + 3], 'big', signed=True),
+    lambda buf, offset: _I32_BE.unpack_from(buf, offset)[0],
+    lambda buf, offset: int.from_bytes(buf[offset:offset + 6], 'big', signed=True),
+    lambda buf, offset: _I64_BE.unpack_from(buf, offset)[0],
+    lambda buf, offset: _F64_BE.unpack_from(buf, offset)[0],
+    lambda buf, offset: 0,
+    lambda buf, offset: 1,
+    _reserved_dtype(10),
+    _reserved_dtype(11),
+)
+
+
+def _read_dtypes(buf: memoryview, offset: int, header_end: int) -> tuple[list, int]:
+    """
+    Read the dtype varints from buf[offset] up to header_end. Returns (dtypes, offset of the first field).
+    """
+    dtypes = []
+    while offset < header_end:
+        # Most dtypes fit in a single byte, so check up to a word's worth of the header at once and take every byte
+        # as a dtype if none of them has its continuation bit set
+        chunk = buf[offset:min(offset + 8, header_end)]
+        if not chunk:
+            raise ValueError(f"varint at offset 0x{offset:08x} runs off the end of the buffer")
+        if not int.from_bytes(chunk, 'big') & _VARINT_MSBS:
+            dtypes.extend(chunk)
+            offset += len(chunk)
+        else:
+            dtype, offset = read_varint(buf, offset)
+            dtypes.append(dtype)
+    return dtypes, offset
+
+
+def parse_record_header(buf: memoryview, offset: int) -> tuple[list, list]:
+    """
+    Walk the header of the record starting at buf[offset] without decoding any of its fields.
+    Returns (dtypes, field_offsets).
+    """
+    record_start_offset = offset
+    header_size, offset = read_varint(buf, offset)
+    dtypes, offset = _read_dtypes(buf, offset, record_start_offset + header_size)
+    field_offsets = [0] * len(dtypes)
+    for i, dtype in enumerate(dtypes):
+        field_offsets[i] = offset
+        if dtype >= 12:
+            offset += (dtype - 12) >> 1
+            continue
+        size = _FIXED_FIELD_SIZES[dtype]
+        if size is None:
+            raise ValueError(
+                f"Unexpected dtype: {dtype} at record starting at offset: 0x{record_start_offset:08x}, field: {i} (of {len(dtypes)} fields) at offset: {offset:08x}")
+        offset += size
+    return dtypes, field_offsets
+
+
+def decode_field(buf: memoryview, offset: int, dtype: int, decode_text: Callable):
+    if dtype < 12:
+        size = _FIXED_FIELD_SIZES[dtype]
+        if size and offset + size > len(buf):
+            raise ValueError(f"field at offset 0x{offset:08x} runs off the end of the buffer")
+        return _FIXED_FIELD_DECODERS[dtype](buf, offset)
+    end = offset + ((dtype - 12) >> 1)
+    if end > len(buf):
+        raise ValueError(f"field at offset 0x{offset:08x} runs off the end of the buffer")
+    if dtype & 1:
+        # final=True so a field that ends part way through a character is an error rather than quietly cut short
+        return decode_text(buf[offset:end], 'strict', True)[0]
+    return buf[offset:end].tobytes()
+
+
+def decode_fields(buf: memoryview, field_offsets: list, dtypes: list, decode_text: Callable) -> list:
+    """
+    Decode every field of a record in one call, given the output of parse_record_header.
+    """
+    return [decode_field(buf, offset, dtype, decode_text) for offset, dtype in zip(field_offsets, dtypes)]
+
+
+_UNDECODED = object()
+
+
 class Record:
-    def __init__(self, file: BinaryIO, encoding: str):
-        self.values = []
-        record_start_offset = file.tell()
-        header_size = read_varint(file)
-        dtypes = []
-        while file.tell() - record_start_offset < header_size:
-            dtypes.append(read_varint(file))
-        for i, dtype in enumerate(dtypes):
-            field_offset = file.tell()
-            match dtype:
-                case 0:
-                    val = None
-                case 1:
-                    val = file.read(1)[0]
-                case 2:
-                    val = struct.unpack(">h", file.read(2))[0]
-                case 3:
-                    # This might go off the end, we'll see if python throws an error...
-                    val = struct.unpack(">i", b'\x00' + file.read(3))[0]
-                case 4:
-                    val = struct.unpack(">i", file.read(4))[0]
-                case 5:
-                    val = struct.unpack(">q", b'\x00\x00' + file.read(6))
-                case 6:
-                    val = struct.unpack(">q", file.read(8))
-                case 7:
-                    # Not sure if this is the right binary IEEE 754 float representation. We'll see...
-                    val = struct.unpack(">d", file.read(8))
-                case 8:
-                    val = 0
-                case 9:
-                    val = 1
-                case x if x >= 12 and x % 2 == 0:  # blob
-                    size = (x - 12) // 2
-                    val = file.read(size)
-                case x if x >= 13 and x % 2 == 1:  # text
-                    size = (x - 13) // 2
-                    val = file.read(size)
-                    val = val.decode(encoding)
-                case _:
-                    raise ValueError(
-                        f"Unexpected dtype: {dtype} at record starting at offset: 0x{record_start_offset:08x}, field: {i} (of {len(dtypes)} fields) at offset: {field_offset:08x}")
-
-            self.values.append(val)
-
-
-@dataclass
+    """
+    Fields are only decoded the first time they're accessed, so e.g. a b-tree search that only looks at the key
+    columns doesn't pay for decoding the rest of the record. Constructing one just walks the record header to find
+    where each field starts.
+    """
+    __slots__ = ('_buf', '_decode_text', '_dtypes', '_field_offsets', '_values')
+
+    def __init__(self, buf: memoryview, offset: int, decode_text: Callable):
+        self._buf = buf
+        self._decode_text = decode_text
+        self._dtypes, self._field_offsets = parse_record_header(buf, offset)
+        self._values = [_UNDECODED] * len(self._dtypes)
+
+    def __len__(self):
+        return len(self._dtypes)
+
+    def __getitem__(self, i: int):
+        val = self._values[i]
+        if val is _UNDECODED:
+            val = self._values[i] = decode_field(self._buf, self._field_offsets[i], self._dtypes[i], self._decode_text)
+        return val
+
+    def prefix(self, n: int) -> tuple:
+        return tuple(self[i] for i in range(n))
+
+    @property
+    def values(self) -> tuple:
+        values = self._values
+        if type(values) is not tuple:
+            # With the C extension built, decoding a fresh record in one call beats going field by field. If some
+            # fields have already been decoded, only the rest are. Once every field is decoded the tuple replaces the
+            # list, since nothing will be written to it again.
+            if all(val is _UNDECODED for val in values):
+                values = decode_fields(self._buf, self._field_offsets, self._dtypes, self._decode_text)
+            else:
+                values = [self[i] for i in range(len(values))]
+            values = self._values = tuple(values)
+        return values
+
+
+def _pack_column(values: list) -> Union[array, list]:
+    """
+    Columns holding nothing but ints or nothing but floats are stored as a flat array('q') / array('d') rather than
+    a list of boxed values. Anything else (NULLs, text, blobs, mixed types) stays a list.
+    """
+    if all(type(val) is int for val in values):
+        return array('q', values)
+    if all(type(val) is float for val in values):
+        return array('d', values)
+    return values
+
+
 class Cell(ABC):
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@dataclass(slots=True)
 class TableLeafCell(Cell):
     row_id: int
     payload_size: int
     record: "Record"
 
-    def __init__(self, file, encoding):
-        self.payload_size = read_varint(file)
-        self.row_id = read_varint(file)
-        self.record = Record(file, encoding)
-
-
-class TableInteriorCell(Cell):
-    child_page_ptr: int
-    key: int
-
-    def __init__(self, file: BinaryIO):
-        self.child_page_ptr = struct.unpack(">I", file.read(4))[0]
-        self.key = read_varint(file)
-
 
+@dataclass(slots=True)
 class IndexInteriorCell(Cell):
     child_page_ptr: int
     payload_size: int
     record: "Record"
 
-    def __init__(self, file: BinaryIO, encoding: str):
-        self.child_page_ptr = struct.unpack(">I", file.read(4))[0]
-        self.payload_size = read_varint(file)
-        self.record = Record(file, encoding)
-
 
+@dataclass(slots=True)
 class IndexLeafCell(Cell):
     payload_size: int
     record: "Record"
 
-    def __init__(self, file: BinaryIO, encoding: str):
-        self.payload_size = read_varint(file)
-        self.record = Record(file, encoding)
-
 
 class BTreePageType(Enum):
     TABLE_INTERIOR = 0x05
@@ -185,8 +320,59 @@ class BTreePageType(Enum):
     INDEX_LEAF = 0x0A
 
 
-@dataclass
+# Looking members up by value through the Enum constructor is surprisingly slow, and we do it for every page
+_PAGE_TYPES = {page_type.value: page_type for page_type in BTreePageType}
+
+
+def parse_page_cells(buf: memoryview, ptrs_offset: int, num_cells: int, page_type: int) -> list:
+    """
+    Decode every cell on a page, given the offset of its cell pointer array. Each cell comes back as a tuple of the
+    fields of the matching *Cell class, in order, with the record (if any) as the offset it starts at. Table interior
+    cells come back as (child_page_ptr, key).
+    """
+    # The cell pointer array is a run of big-endian u16s, so load it in one go and fix up the byte order
+    # rather than building a fresh struct format string for every page
+    ptrs = array('H')
+    ptrs.frombytes(buf[ptrs_offset:ptrs_offset + 2 * num_cells])
+    if sys.byteorder == 'little':
+        ptrs.byteswap()
+
+    cells = [None] * num_cells
+    # Visit the cells in the order they're laid out in the page rather than in key order, so the reads move steadily
+    # forward through the buffer
+    order = sorted(range(num_cells), key=ptrs.__getitem__)
+    match _PAGE_TYPES[page_type]:
+        case BTreePageType.TABLE_LEAF:
+            for i in order:
+                payload_size, offset = read_varint(buf, ptrs[i])
+                row_id, offset = read_varint(buf, offset)
+                cells[i] = (row_id, payload_size, offset)
+        case BTreePageType.TABLE_INTERIOR:
+            for i in order:
+                ptr = ptrs[i]
+                cells[i] = (_U32_BE.unpack_from(buf, ptr)[0], read_varint(buf, ptr + 4)[0])
+        case BTreePageType.INDEX_INTERIOR:
+            for i in order:
+                ptr = ptrs[i]
+                payload_size, offset = read_varint(buf, ptr + 4)
+                cells[i] = (_U32_BE.unpack_from(buf, ptr)[0], payload_size, offset)
+        case BTreePageType.INDEX_LEAF:
+            for i in order:
+                payload_size, offset = read_varint(buf, ptrs[i])
+                cells[i] = (payload_size, offset)
+    return cells
+
+
+try:
+    # Optional C implementations of the hot decoding functions above, see _record.pyx
+    from _record import read_varint, parse_record_header, decode_field, decode_fields, parse_page_cells
+except ImportError:
+    pass
+
+
 class PageHeader:
+    __slots__ = ('type_id', 'first_free_block_offset', 'num_cells_in_page', 'cell_content_area_offset',
+                 'fragmented_free_bytes', 'right_ptr', 'header_size')
     type_id: BTreePageType
     first_free_block_offset: int
     num_cells_in_page: int
@@ -195,166 +381,258 @@ class PageHeader:
     right_ptr: Optional[int]
     header_size: int
 
-    def __init__(self, file: BinaryIO):
-        self.type_id = BTreePageType(file.read(1)[0])
-        (self.first_free_block_offset,
-         self.num_cells_in_page,
-         self.cell_content_area_offset,
-         self.fragmented_free_bytes) = struct.unpack(">3HB", file.read(7))
+    def __init__(self, buf: memoryview, offset: int, type_id: BTreePageType):
+        # The type byte has already been read to pick the page class, so it's passed in rather than decoded again
+        self.type_id = type_id
         if self.type_id in (BTreePageType.TABLE_INTERIOR, BTreePageType.INDEX_INTERIOR):
-            self.right_ptr = struct.unpack(">I", file.read(4))[0]
+            (self.first_free_block_offset,
+             self.num_cells_in_page,
+             self.cell_content_area_offset,
+             self.fragmented_free_bytes,
+             self.right_ptr) = _INTERIOR_PAGEHDR.unpack_from(buf, offset + 1)
             self.header_size = 12
         else:
+            (self.first_free_block_offset,
+             self.num_cells_in_page,
+             self.cell_content_area_offset,
+             self.fragmented_free_bytes) = _PAGEHDR.unpack_from(buf, offset + 1)
             self.right_ptr = None
             self.header_size = 8
 
 
-@dataclass
 class Page(ABC):
-    offset: int
+    __slots__ = ('header_offset', 'pageHeader', 'cells', '_records', '_columns')
+    header_offset: int
     pageHeader: PageHeader
     cells: List[Cell]
+    page_type: BTreePageType
 
-    def __init__(self, file: BinaryIO):
-        self.offset = file.tell()
-        # If this is the first page of the database, the file-level header shifts everything by 100 bytes
-        if self.offset <= 100:
-            self.offset = 0
-        self.cells = []
-        self.pageHeader = PageHeader(file)
+    def __init__(self, buf: memoryview, offset: int):
+        # offset is where the page header starts within buf. It's 0 for every page except the first page of the
+        # database, where the file-level header shifts it by 100 bytes. Cell pointers are relative to the start of
+        # the page either way.
+        self.header_offset = offset
+        self.pageHeader = PageHeader(buf, offset, self.page_type)
+        self._records = None
+        self._columns = None
+
+    def parse_cells(self, buf: memoryview) -> list:
+        return parse_page_cells(buf, self.header_offset + self.pageHeader.header_size,
+                                self.pageHeader.num_cells_in_page, self.pageHeader.type_id.value)
 
     @staticmethod
-    def build_page(database: "Database", file: BinaryIO) -> "Page":
-        page_type = BTreePageType(file.read(1)[0])
-        file.seek(-1, os.SEEK_CUR)
+    def build_page(database: "Database", buf: memoryview, offset: int) -> "Page":
+        page_type = _PAGE_TYPES.get(buf[offset])
         match page_type:
             case BTreePageType.TABLE_LEAF:
-                return TableLeafPage(file, database)
+                return TableLeafPage(buf, offset, database)
             case BTreePageType.TABLE_INTERIOR:
-                return TableInteriorPage(file, database)
+                return TableInteriorPage(buf, offset, database)
             case BTreePageType.INDEX_INTERIOR:
-                return IndexInteriorPage(file, database)
+                return IndexInteriorPage(buf, offset, database)
             case BTreePageType.INDEX_LEAF:
-                return IndexLeafPage(file, database)
+                return IndexLeafPage(buf, offset, database)
             case _:
-                raise ValueError(f"Unsupported page type: {page_type}")
+                raise ValueError(f"Unsupported page type: {buf[offset]}")
 
     @property
     def records(self):
-        return [cell.record for cell in sorted(self.cells, key=lambda cell: cell.row_id)]
+        if self._records is None:
+            self._records = [cell.record for cell in sorted(self.cells, key=attrgetter("row_id"))]
+        return self._records
+
+    @property
+    def columns(self) -> list:
+        """
+        The records of this page's cells, in key order, stored column by column: columns[j][i] is field j of the
+        record in cells[i]. Records with fewer fields than the widest one are padded with None.
+        """
+        if self._columns is None:
+            records = [cell.record for cell in self.cells]
+            self._columns = [
+                _pack_column([record[i] if i < len(record) else None for record in records])
+                for i in range(max(map(len, records), default=0))
+            ]
+        return self._columns
 
     @abstractmethod
     def get_record(self, key: any) -> Optional["Record"]:
         pass
 
 
-@dataclass
 class TableLeafPage(Page):
+    __slots__ = ('_keys',)
+    page_type = BTreePageType.TABLE_LEAF
     cells: List[TableLeafCell]
+    _keys: List[int]
 
-    def __init__(self, file: BinaryIO, db: "Database"):
-        super().__init__(file)
+    def __init__(self, buf: memoryview, offset: int, db: "Database"):
+        super().__init__(buf, offset)
 
-        num_cells = self.pageHeader.num_cells_in_page
-        cell_ptrs = struct.unpack(f'>{num_cells}H', file.read(num_cells * 2))
-        for ptr in cell_ptrs:
-            file.seek(self.offset + ptr)
-            self.cells.append(TableLeafCell(file, db.header.text_encoding))
+        parsed_cells = self.parse_cells(buf)
+        self.cells = [None] * len(parsed_cells)
+        for i, (row_id, payload_size, record_offset) in enumerate(parsed_cells):
+            self.cells[i] = TableLeafCell(row_id, payload_size, Record(buf, record_offset, db.header.decode_text))
+        # sqlite keeps the cell pointer array in key order, so this is already sorted. Keeping the keys in their own
+        # list lets bisect compare them directly instead of calling a key function on every probe.
+        self._keys = [cell.row_id for cell in self.cells]
 
     def get_record(self, row_id: int) -> Optional[Record]:
-        idx = bisect_left(self.cells, row_id, key=lambda cell: cell.row_id)
-        if idx < len(self.cells) and self.cells[idx].row_id == row_id:
+        idx = bisect_left(self._keys, row_id)
+        if idx < len(self._keys) and self._keys[idx] == row_id:
             return self.cells[idx].record
         else:
             return None
 
 
-@dataclass
 class TableInteriorPage(Page):
+    __slots__ = ('database', '_child_ptrs', '_keys')
+    page_type = BTreePageType.TABLE_INTERIOR
     database: "Database"
-    cells: List[TableInteriorCell]
+    _child_ptrs: List[int]
+    _keys: List[int]
 
-    def __init__(self, file: BinaryIO, database: "Database"):
-        super().__init__(file)
+    def __init__(self, buf: memoryview, offset: int, database: "Database"):
+        super().__init__(buf, offset)
 
         self.database = database
-        num_cells = self.pageHeader.num_cells_in_page
-        cell_ptrs = struct.unpack(f'>{num_cells}H', file.read(num_cells * 2))
-        for ptr in cell_ptrs:
-            file.seek(self.offset + ptr)
-            self.cells.append(TableInteriorCell(file))
+        # A search only ever needs a cell's key and child pointer, so keep those in two parallel lists rather than
+        # allocating a cell object for each one
+        self.cells = []
+        parsed_cells = self.parse_cells(buf)
+        self._child_ptrs = [child_page_ptr for child_page_ptr, _ in parsed_cells]
+        self._keys = [key for _, key in parsed_cells]
 
     def get_record(self, row_id) -> Optional[Record]:
-        idx = bisect_left(self.cells, row_id, key=lambda cell: cell.key)
-        if idx < len(self.cells) and self.cells[idx].key >= row_id:
-            child_page = self.database.get_page(self.cells[idx].child_page_ptr)
+        idx = bisect_left(self._keys, row_id)
+        if idx < len(self._keys):
+            child_page_num = self._child_ptrs[idx]
         else:
-            child_page = self.database.get_page(self.pageHeader.right_ptr)
-        return child_page.get_record(row_id)
+            child_page_num = self.pageHeader.right_ptr
+        self.database.prefetch_page(child_page_num)
+        return self.database.get_page(child_page_num).get_record(row_id)
 
 
-@dataclass
-class IndexInteriorPage(Page):
+class IndexPage(Page, ABC):
+    __slots__ = ('database', '_key_prefixes')
     database: "Database"
+    cells: List[Union["IndexInteriorCell", "IndexLeafCell"]]
+
+    def __init__(self, buf: memoryview, offset: int):
+        super().__init__(buf, offset)
+        self._key_prefixes: dict[int, List[tuple]] = {}
+
+    def key_prefixes(self, n: int) -> List[tuple]:
+        """
+        The first n columns of every cell's record, in order. Searches bisect over this instead of the full records
+        so only the columns that take part in the comparison ever get decoded, and the comparisons stay in C.
+        """
+        prefixes = self._key_prefixes.get(n)
+        if prefixes is None:
+            prefixes = self._key_prefixes[n] = [cell.record.prefix(n) for cell in self.cells]
+        return prefixes
+
+
+class IndexInteriorPage(IndexPage):
+    __slots__ = ()
+    page_type = BTreePageType.INDEX_INTERIOR
     cells: List[IndexInteriorCell]
 
-    def __init__(self, file: BinaryIO, db: "Database"):
-        super().__init__(file)
+    def __init__(self, buf: memoryview, offset: int, db: "Database"):
+        super().__init__(buf, offset)
 
         self.database = db
-        num_cells = self.pageHeader.num_cells_in_page
-        cell_ptrs = struct.unpack(f'>{num_cells}H', file.read(num_cells * 2))
-        for ptr in cell_ptrs:
-            file.seek(self.offset + ptr)
-            self.cells.append(IndexInteriorCell(file, db.header.text_encoding))
-
-    def get_record(self, key: List[any]) -> Optional[Record]:
-        idx = bisect_left(self.cells, key, key=lambda cell: cell.record.values)
-        if idx < len(self.cells) and self.cells[idx].record.values >= key:
-            child_page = self.database.get_page(self.cells[idx].child_page_ptr)
+        parsed_cells = self.parse_cells(buf)
+        self.cells = [None] * len(parsed_cells)
+        for i, (child_page_ptr, payload_size, record_offset) in enumerate(parsed_cells):
+            self.cells[i] = IndexInteriorCell(child_page_ptr, payload_size,
+                                              Record(buf, record_offset, db.header.decode_text))
+
+    def get_record(self, key: tuple) -> Optional[Record]:
+        prefixes = self.key_prefixes(len(key))
+        idx = bisect_left(prefixes, key)
+        if idx < len(self.cells):
+            if prefixes[idx] == key:
+                # Interior cells of an index hold entries of their own, not just copies of ones further down
+                return get_user_info_by_id(self.database, self.cells[idx].record[-1])
+            child_page_num = self.cells[idx].child_page_ptr
         else:
-            child_page = self.database.get_page(self.pageHeader.right_ptr)
-        return child_page.get_record(key)
+            child_page_num = self.pageHeader.right_ptr
+        self.database.prefetch_page(child_page_num)
+        return self.database.get_page(child_page_num).get_record(key)
 
 
-class IndexLeafPage(Page):
+class IndexLeafPage(IndexPage):
+    __slots__ = ()
+    page_type = BTreePageType.INDEX_LEAF
     cells: List[IndexLeafCell]
 
-    def __init__(self, file: BinaryIO, db: "Database"):
-        super().__init__(file)
+    def __init__(self, buf: memoryview, offset: int, db: "Database"):
+        super().__init__(buf, offset)
         self.database = db
-        num_cells = self.pageHeader.num_cells_in_page
-        cell_ptrs = struct.unpack(f'>{num_cells}H', file.read(num_cells * 2))
-        for ptr in cell_ptrs:
-            file.seek(self.offset + ptr)
-            self.cells.append(IndexLeafCell(file, db.header.text_encoding))
-
-    def get_record(self, key: List[any]) -> Optional[Record]:
-        idx = bisect_left(self.cells, key, key=lambda cell: cell.record.values)
-        if idx >= len(self.cells) or self.cells[idx].record.values[:len(key)] != key:
+        parsed_cells = self.parse_cells(buf)
+        self.cells = [None] * len(parsed_cells)
+        for i, (payload_size, record_offset) in enumerate(parsed_cells):
+            self.cells[i] = IndexLeafCell(payload_size, Record(buf, record_offset, db.header.decode_text))
+
+    def get_record(self, key: tuple) -> Optional[Record]:
+        prefixes = self.key_prefixes(len(key))
+        idx = bisect_left(prefixes, key)
+        if idx >= len(prefixes) or prefixes[idx] != key:
             return None
-        cell_row_id = self.cells[idx].record.values[-1]
+        cell_row_id = self.cells[idx].record[-1]
         return get_user_info_by_id(self.database, cell_row_id)
 
 
 class Database:
     def __init__(self, file: BinaryIO):
         self.file = file
-        self.header = FileHeader(file)
+        # Either way a page is just a slice of self.mv, rather than a seek + read into a fresh bytes object. Small files
+        # are read in whole, which is one read call up front instead of a page fault for every page touched later.
+        file.seek(0, 2)
+        if file.tell() < _IN_MEMORY_MAX_SIZE:
+            file.seek(0)
+            self.mm = None
+            self.mv = memoryview(file.read())
+        else:
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mv = memoryview(self.mm)
+        self.header = FileHeader(self.mv)
+        # Pages are never modified once they're parsed, so every lookup can share them (the schema page and the
+        # upper levels of each b-tree especially get hit on every query)
+        self._pages: dict[int, Page] = {}
         self.schema_page = self.get_page(1)
-
-    def get_root_page_num(self, target_object_name, target_object_type="table"):
-        for record in self.schema_page.records:
-            object_type, object_name, object_table, object_page, schema = record.values
-            if object_name == target_object_name and object_type == target_object_type:
-                return object_page
+        # Index the schema table once up front, keyed by (name, type). Only the type, name and root page columns are
+        # needed for that, so the table name and sql columns never get decoded.
+        self._schema_index: dict[tuple[str, str], int] = {
+            (record[1], record[0]): record[3] for record in self.schema_page.records
+        }
+
+    def get_root_page_num(self, target_object_name, target_object_type="table") -> Optional[int]:
+        return self._schema_index.get((target_object_name, target_object_type))
+
+    def prefetch_page(self, page_number):
+        """
+        Tell the OS we're about to read a page that isn't cached yet, so on a cold cache the whole page gets read in
+        with one request instead of being faulted in piece by piece as it's parsed.
+        """
+        if self.mm is None or page_number in self._pages or not hasattr(mmap, "MADV_WILLNEED"):
+            return
+        page_offset = (page_number - 1) * self.header.page_size
+        # madvise wants an address aligned to the OS page size, which can be bigger than the database's page size
+        start = page_offset - page_offset % mmap.PAGESIZE
+        self.mm.madvise(mmap.MADV_WILLNEED, start, page_offset + self.header.page_size - start)
 
     def get_page(self, page_number) -> Page:
+        page = self._pages.get(page_number)
+        if page is None:
+            page = self._pages[page_number] = self._read_page(page_number)
+        return page
+
+    def _read_page(self, page_number) -> Page:
         page_offset = (page_number - 1) * self.header.page_size
-        if page_offset == 0:
-            page_offset += 100
-        self.file.seek(page_offset)
-        return Page.build_page(self, self.file)
+        buf = self.mv[page_offset:page_offset + self.header.page_size]
+        return Page.build_page(self, buf, 100 if page_number == 1 else 0)
 
 
 def get_user_info_by_id(db, row_id) -> Record | None:
@@ -374,7 +652,7 @@ def get_user_info_by_email(db, email):
     # to indicate which column(s) they pertain to.
     page_num = db.get_root_page_num("sqlite_autoindex_users_2", "index")
     root_page = db.get_page(page_num)
-    record = root_page.get_record([email])
+    record = root_page.get_record((email,))
     return record
 
 
@@ -393,26 +671,5 @@ def main():
             print(f"Couldn't find user info by email")
 
 
-try:
-    import pytest
-
-
-    @pytest.mark.parametrize(
-        "data, expected_val, expected_delta",
-        [
-            (b"\x00", 0, 1),
-            (b"\x81\x01", 0b10000001, 2),
-            (b"\x81\x81\x01", 0b100000010000001, 3),
-            (b"\x81" * 8 + b"\x01", 0x0204081020408101, 9),
-        ],
-    )
-    def test_read_varint(data, expected_val, expected_delta):
-        buffer = BytesIO(data)
-        buffer.seek(0)
-        actual_val = read_varint(buffer)
-        assert bin(actual_val) == bin(expected_val)
-except ImportError:
-    pass
-
 if __name__ == "__main__":
     main()
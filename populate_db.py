@@ -1,9 +1,19 @@
 import sqlite3
 
-# Connect to SQLite database (or create it if it doesn't exist)
-conn = sqlite3.connect("example.db")
+# Connect to SQLite database (or create it if it doesn't exist). isolation_level=None stops the sqlite3 module from
+# opening transactions behind our back, so the only one is the explicit BEGIN/COMMIT around the inserts.
+conn = sqlite3.connect("example.db", isolation_level=None)
 cursor = conn.cursor()
 
+# This is a throwaway test database, so trade durability for load speed. The rollback journal is kept in memory
+# rather than switching to WAL, since WAL mode sticks to the file and the parser only ever reads the main file.
+cursor.execute("PRAGMA journal_mode=MEMORY")
+cursor.execute("PRAGMA synchronous=NORMAL")
+cursor.execute("PRAGMA temp_store=MEMORY")
+# Bigger pages mean fewer b-tree levels and fewer pages to read per lookup. This has to happen before the first
+# write to take effect, so it only applies when the database is being created.
+cursor.execute("PRAGMA page_size=8192")
+
 # Create the users table if it doesn't exist
 cursor.execute("""
 CREATE TABLE IF NOT EXISTS users (
@@ -23,13 +33,14 @@ for i in range(1, 1001):
     password = f"password_{i}"  # Predictable test value for password
     users_to_insert.append((username, email, password))
 
-# Use executemany for batch insertion
+# Use executemany for batch insertion, all inside one transaction
+cursor.execute("BEGIN")
 cursor.executemany("""
 INSERT INTO users (username, email, password_hash)
 VALUES (?, ?, ?)
 """, users_to_insert)
 
 # Commit changes and close connection
-conn.commit()
+cursor.execute("COMMIT")
 conn.close()
 
@@ -0,0 +1,148 @@
+import codecs
+from pathlib import Path
+
+import pytest
+
+from parse_database import (read_varint, decode_field, decode_fields, parse_record_header, Record, Database,
+                            TableLeafPage, IndexInteriorPage, IndexLeafPage, _pack_column, get_user_info_by_email)
+
+
+@pytest.mark.parametrize(
+    "data, expected_val, expected_delta",
+    [
+        (b"\x00", 0, 1),
+        (b"\x81\x01", 0b10000001, 2),
+        (b"\x81\x81\x01", 0b100000010000001, 3),
+        (b"\x81" * 8 + b"\x01", 0x0204081020408101, 9),
+        (b"\x7f\xff\xff", 0x7f, 1),
+        (b"\xff" * 9, 0xffffffffffffffff, 9),
+    ],
+)
+def test_read_varint(data, expected_val, expected_delta):
+    actual_val, actual_pos = read_varint(data, 0)
+    assert bin(actual_val) == bin(expected_val)
+    assert actual_pos == expected_delta
+
+
+@pytest.mark.parametrize(
+    "data, pos",
+    [
+        (b"", 0),
+        (b"\x81", 0),
+        (b"\x81\x81", 0),
+        (b"\x81\x01", 2),
+        (b"\x81" * 8, 0),
+    ],
+)
+def test_read_varint_out_of_bounds(data, pos):
+    with pytest.raises(ValueError):
+        read_varint(data, pos)
+
+
+@pytest.mark.parametrize(
+    "dtype, data, expected_val",
+    [
+        (0, b"", None),
+        (1, b"\xff", -1),
+        (1, b"\x7f", 127),
+        (2, b"\xff\xfe", -2),
+        (3, b"\x80\x00\x01", -0x7fffff),
+        (4, b"\x00\x01\x00\x00", 0x10000),
+        (5, b"\xff\xff\xff\xff\xff\xfe", -2),
+        (6, b"\x7f" + b"\xff" * 7, 0x7fffffffffffffff),
+        (7, b"\x3f\xf8" + b"\x00" * 6, 1.5),
+        (8, b"", 0),
+        (9, b"", 1),
+        (12 + 2 * 3, b"\x00\x01\x02", b"\x00\x01\x02"),
+        (13 + 2 * 3, b"abc", "abc"),
+        (13 + 2 * 3, b"ab\xc3", UnicodeDecodeError),
+        # Fields that run off the end of the buffer
+        (2, b"\x01", ValueError),
+        (3, b"\x01", ValueError),
+        (5, b"\x01", ValueError),
+        (7, b"\x01", ValueError),
+        (12 + 2 * 5, b"\x01", ValueError),
+        (13 + 2 * 5, b"\x01", ValueError),
+    ],
+)
+def test_decode_field(dtype, data, expected_val):
+    buf = memoryview(b"\xaa" + data + (b"" if expected_val is ValueError else b"\xaa"))
+    if isinstance(expected_val, type) and issubclass(expected_val, Exception):
+        with pytest.raises(expected_val):
+            decode_field(buf, 1, dtype, codecs.utf_8_decode)
+        return
+    actual_val = decode_field(buf, 1, dtype, codecs.utf_8_decode)
+    assert type(actual_val) is type(expected_val)
+    assert actual_val == expected_val
+
+
+def test_parse_record_header():
+    # Enough single byte dtypes to fill a whole word, then a two byte one (a 60 character text field)
+    dtypes = [1] * 9 + [13 + 2 * 60, 0, 9]
+    header = bytes([1] * 9) + b"\x81\x05" + b"\x00\x09"
+    buf = memoryview(b"\xaa" + bytes([len(header) + 1]) + header + b"\x00" * 69)
+    actual_dtypes, actual_offsets = parse_record_header(buf, 1)
+    assert list(actual_dtypes) == dtypes
+    body_start = 2 + len(header)
+    assert list(actual_offsets) == [body_start + i for i in range(10)] + [body_start + 69] * 2
+    # A header size that points past the end of the buffer
+    with pytest.raises(ValueError):
+        parse_record_header(memoryview(b"\x05\x01"), 0)
+    with pytest.raises(ValueError):
+        parse_record_header(memoryview(b"\x03\x81"), 0)
+
+
+# A record holding -1, "abc", 1.5 and NULL
+RECORD = memoryview(b"\xaa" + bytes([5, 1, 13 + 2 * 3, 7, 0]) + b"\xff" + b"abc" + b"\x3f\xf8" + b"\x00" * 6)
+
+
+def test_decode_fields():
+    dtypes, field_offsets = parse_record_header(RECORD, 1)
+    assert list(decode_fields(RECORD, field_offsets, dtypes, codecs.utf_8_decode)) == [-1, "abc", 1.5, None]
+
+
+def test_record_values():
+    record = Record(RECORD, 1, codecs.utf_8_decode)
+    text = record[1]
+    assert text == "abc"
+    assert record.values == (-1, "abc", 1.5, None)
+    # Fields decoded before values is read are reused rather than decoded again
+    assert record.values[1] is text
+    assert record.values is record.values
+    assert record[2] == 1.5
+
+
+@pytest.mark.parametrize(
+    "values, expected_typecode",
+    [
+        ([1, -2, 0x7fffffffffffffff], 'q'),
+        ([1.5, -2.0], 'd'),
+        ([1, 2.5], None),
+        ([None, 1], None),
+        (["a", "b"], None),
+    ],
+)
+def test_pack_column(values, expected_typecode):
+    column = _pack_column(values)
+    assert getattr(column, "typecode", None) == expected_typecode
+    assert list(column) == values
+
+
+@pytest.mark.parametrize("page_class", [TableLeafPage, IndexInteriorPage, IndexLeafPage])
+def test_page_columns(page_class):
+    with open(Path(__file__).parent.parent / "example.db", "rb") as f:
+        db = Database(f)
+        page = next(page for page in map(db.get_page, range(1, db.header.file_size_pages + 1))
+                    if type(page) is page_class)
+        columns = page.columns
+        assert len(columns) == max(len(cell.record) for cell in page.cells)
+        for i, cell in enumerate(page.cells):
+            assert [column[i] for column in columns] == list(cell.record.values)
+
+
+def test_get_user_info_by_email():
+    with open(Path(__file__).parent.parent / "example.db", "rb") as f:
+        db = Database(f)
+        for i in range(1, 1001):
+            assert get_user_info_by_email(db, f"user_{i}@example.com")[2] == f"user_{i}@example.com"
+        assert get_user_info_by_email(db, "nobody@example.com") is None